@@ -4,20 +4,32 @@
 LangChainのChatPromptTemplateに変換して、変数を適用したメッセージを生成します。
 """
 
+import functools
 from typing import Any, Dict
 
 from langfuse import Langfuse, get_client
+from langchain_core.prompt_values import ChatPromptValue
 from langchain_core.prompts import ChatPromptTemplate
 from dotenv import load_dotenv
 
+from langfuse_prompt_utils import (
+    build_messages_from_compiled_prompt,
+    fetch_prompt_template_from_langfuse,
+    get_or_compile_template,
+)
+
 
 # 環境変数の読み込み
 load_dotenv()
 
 
+@functools.cache
 def initialize_langfuse_client() -> Langfuse:
     """Langfuseクライアントを初期化します。
 
+    クライアントはプロセス内で1度だけ生成され、以降の呼び出しでは
+    同じインスタンス（接続プールを含む）が再利用されます。
+
     Returns:
         Langfuse: 初期化されたLangfuseクライアントインスタンス。
     """
@@ -25,44 +37,19 @@ def initialize_langfuse_client() -> Langfuse:
     return langfuse_client
 
 
-def fetch_prompt_template_from_langfuse(
-    langfuse_client: Langfuse,
-    prompt_name: str,
-    prompt_type: str = "chat",
-    label: str = "latest"
-) -> Any:
-    """Langfuseからプロンプトテンプレートを取得します。
-
-    Args:
-        langfuse_client (Langfuse): Langfuseクライアントインスタンス。
-        prompt_name (str): 取得するプロンプトの名前。
-        prompt_type (str): プロンプトのタイプ。デフォルトは"chat"。
-        label (str): プロンプトのラベル/バージョン。デフォルトは"latest"。
-
-    Returns:
-        Any: Langfuseプロンプトテンプレートオブジェクト。
-    """
-    prompt_template = langfuse_client.get_prompt(
-        prompt_name,
-        type=prompt_type,
-        label=label
-    )
-    return prompt_template
-
-
 def convert_langfuse_to_langchain_template(prompt_template: Any) -> ChatPromptTemplate:
     """LangfuseプロンプトテンプレートをLangChainテンプレートに変換します。
 
+    変換結果はプロンプト名とバージョンをキーにキャッシュされ、
+    同じバージョンのテンプレートは1度だけコンパイルされます。
+
     Args:
         prompt_template: Langfuseプロンプトテンプレートオブジェクト。
 
     Returns:
         ChatPromptTemplate: LangChainのChatPromptTemplateインスタンス。
     """
-    langchain_prompt_template = ChatPromptTemplate(
-        prompt_template.get_langchain_prompt()
-    )
-    return langchain_prompt_template
+    return get_or_compile_template(prompt_template)
 
 
 def generate_prompt_messages_with_variables(
@@ -82,6 +69,33 @@ def generate_prompt_messages_with_variables(
     return prompt_messages
 
 
+def compile_prompt_messages_with_langfuse(
+    prompt_template: Any,
+    variables: Dict[str, str]
+) -> ChatPromptValue:
+    """Langfuseのコンパイル機能で変数を適用し、LangChainのメッセージを生成します。
+
+    ChatPromptTemplateを経由せずにメッセージを直接構築します。未解決の変数や
+    プレースホルダーが残る場合は、LangChainテンプレート経由で生成します。
+
+    Args:
+        prompt_template: Langfuseプロンプトテンプレートオブジェクト。
+        variables (Dict[str, str]): テンプレートに適用する変数の辞書。
+
+    Returns:
+        ChatPromptValue: 変数が適用されたプロンプトメッセージオブジェクト。
+
+    Raises:
+        KeyError: テンプレートに必要な変数がvariablesに含まれていない場合。
+    """
+    prompt_messages = build_messages_from_compiled_prompt(prompt_template, variables)
+    if prompt_messages is not None:
+        return prompt_messages
+
+    langchain_template = convert_langfuse_to_langchain_template(prompt_template)
+    return generate_prompt_messages_with_variables(langchain_template, variables)
+
+
 def display_prompt_messages(prompt_messages: Any) -> None:
     """プロンプトメッセージを標準出力に表示します。
 
@@ -94,8 +108,8 @@ def display_prompt_messages(prompt_messages: Any) -> None:
 def main() -> None:
     """メイン実行関数。
 
-    Langfuseからプロンプトテンプレートを取得し、LangChainテンプレートに変換して、
-    変数を適用したメッセージを生成・表示します。
+    Langfuseからプロンプトテンプレートを取得し、変数を適用した
+    LangChainのメッセージを生成・表示します。
     """
     # Langfuseクライアントの初期化
     langfuse_client = initialize_langfuse_client()
@@ -108,13 +122,10 @@ def main() -> None:
         label="latest"
     )
 
-    # LangChainテンプレートに変換
-    langchain_template = convert_langfuse_to_langchain_template(prompt_template)
-
     # 変数を適用してメッセージを生成
     template_variables = {"city": "東京都"}
-    prompt_messages = generate_prompt_messages_with_variables(
-        langchain_template=langchain_template,
+    prompt_messages = compile_prompt_messages_with_langfuse(
+        prompt_template=prompt_template,
         variables=template_variables
     )
 
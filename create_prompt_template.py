@@ -5,6 +5,7 @@
 温度パラメータなどを含めることができます。
 """
 
+import functools
 from typing import Any, Dict, List
 
 from langfuse import Langfuse, get_client
@@ -15,9 +16,13 @@ from dotenv import load_dotenv
 load_dotenv()
 
 
+@functools.cache
 def initialize_langfuse_client() -> Langfuse:
     """Langfuseクライアントを初期化します。
 
+    クライアントはプロセス内で1度だけ生成され、以降の呼び出しでは
+    同じインスタンス（接続プールを含む）が再利用されます。
+
     Returns:
         Langfuse: 初期化されたLangfuseクライアントインスタンス。
     """
@@ -5,38 +5,74 @@
 AWS Bedrock上のモデルとTavily Web検索を統合し、全ての実行をLangfuseでトレーシングします。
 """
 
-from typing import Any, Dict, List
-
-from langchain.chat_models import init_chat_model
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_tavily import TavilySearch
-from langfuse import Langfuse, get_client
-from langfuse.langchain import CallbackHandler
-from langgraph.prebuilt import create_react_agent
+from __future__ import annotations
+
+import atexit
+import functools
+import importlib
+import threading
+from typing import TYPE_CHECKING, Any, Dict, List
+
+from langfuse import Langfuse
 from dotenv import load_dotenv
 
+from langfuse_prompt_utils import (
+    build_messages_from_compiled_prompt,
+    fetch_prompt_template_from_langfuse,
+    get_or_compile_template,
+)
+
+# 起動時間短縮のため、重いモジュールは使用する関数内で遅延インポートする
+if TYPE_CHECKING:
+    from langchain_tavily import TavilySearch
+    from langfuse.langchain import CallbackHandler
+
 
 # 環境変数の読み込み
 load_dotenv()
 
+# Langfuseイベントのバッチ送信設定（件数・間隔（秒））
+LANGFUSE_FLUSH_AT = 50
+LANGFUSE_FLUSH_INTERVAL = 10.0
+
+# バッチ実行時の最大同時実行数
+AGENT_BATCH_MAX_CONCURRENCY = 8
 
+
+@functools.cache
 def initialize_langfuse_client() -> Langfuse:
     """Langfuseクライアントを初期化します。
 
+    クライアントはプロセス内で1度だけ生成され、以降の呼び出しでは
+    同じインスタンス（接続プールを含む）が再利用されます。
+    イベントはバッチでまとめて送信され、プロセス終了時に未送信分がフラッシュされます。
+
     Returns:
         Langfuse: 初期化されたLangfuseクライアントインスタンス。
     """
-    langfuse_client = get_client()
+    # sample_rateはあえて指定せず、SDKに環境変数LANGFUSE_SAMPLE_RATEを読み取らせる。
+    # ここで値を直接指定すると、get_client()を使う@observe側とサンプリング率が食い違う
+    langfuse_client = Langfuse(
+        flush_at=LANGFUSE_FLUSH_AT,
+        flush_interval=LANGFUSE_FLUSH_INTERVAL
+    )
+    atexit.register(langfuse_client.flush)
     return langfuse_client
 
 
-def fetch_prompt_template_from_langfuse(
+def warm_prompt_cache(
     langfuse_client: Langfuse,
     prompt_name: str,
     prompt_type: str = "chat",
     label: str = "latest"
-) -> Any:
-    """Langfuseからプロンプトテンプレートを取得します。
+) -> threading.Thread:
+    """バックグラウンドでプロンプトテンプレートを取得し、キャッシュを温めます。
+
+    取得処理を別スレッドで開始するため、呼び出し元は他の初期化処理と並行して
+    進めることができます。スレッドの完了後はキャッシュから取得されます。
+    バックグラウンドでの取得エラーは送出されずに破棄されます。取得に失敗した場合は、
+    スレッドの完了後に呼び出し元が行うfetch_prompt_template_from_langfuseの
+    呼び出しで改めて取得が行われ、エラーが送出されます。
 
     Args:
         langfuse_client (Langfuse): Langfuseクライアントインスタンス。
@@ -45,14 +81,30 @@ def fetch_prompt_template_from_langfuse(
         label (str): プロンプトのラベル/バージョン。デフォルトは"latest"。
 
     Returns:
-        Any: Langfuseプロンプトテンプレートオブジェクト。
+        threading.Thread: 取得処理を実行しているデーモンスレッド。
     """
-    prompt_template = langfuse_client.get_prompt(
-        prompt_name,
-        type=prompt_type,
-        label=label
-    )
-    return prompt_template
+    def fetch_prompt_template_quietly() -> None:
+        try:
+            fetch_prompt_template_from_langfuse(langfuse_client, prompt_name, prompt_type, label)
+        except Exception:
+            # エラーはフォアグラウンドでの再取得時に送出される
+            pass
+
+    warm_thread = threading.Thread(target=fetch_prompt_template_quietly, daemon=True)
+    warm_thread.start()
+    return warm_thread
+
+
+def preload_agent_dependencies() -> None:
+    """プロンプトに依存しないエージェントの依存関係を事前に読み込みます。
+
+    遅延インポートしているLangChain/LangGraphのモジュールを読み込み、
+    Web検索ツールを構築します。プロンプトの事前取得と並行して実行することで、
+    起動時の待ち時間を短縮します。
+    """
+    for module_name in ("langchain.chat_models", "langgraph.prebuilt"):
+        importlib.import_module(module_name)
+    initialize_web_search_tool(max_results=2, topic="general")
 
 
 def extract_model_configuration(prompt_template: Any) -> Dict[str, Any]:
@@ -75,25 +127,66 @@ def extract_model_configuration(prompt_template: Any) -> Dict[str, Any]:
     }
 
 
-def create_react_agent_with_config(model_name: str, temperature: float) -> Any:
-    """指定された設定でReActエージェントを構築します。
+@functools.cache
+def initialize_chat_model(model_name: str, temperature: float) -> Any:
+    """AWS Bedrock上のチャットモデルを初期化します。
+
+    モデル（内部のBedrockクライアントを含む）は(model_name, temperature)ごとに
+    1度だけ生成され、再利用されます。
 
     Args:
         model_name (str): 使用するAWSモデルの識別子。
         temperature (float): モデルの温度パラメータ（0.0-1.0）。
 
     Returns:
-        CompiledGraph: 構築されたLangGraph ReActエージェントインスタンス。
+        ChatModel: 設定済みのLangChainチャットモデルインスタンス。
     """
-    # チャットモデルの初期化
+    from langchain.chat_models import init_chat_model
+
     chat_model = init_chat_model(
         model=model_name,
         model_provider="bedrock_converse",
         temperature=temperature
     )
+    return chat_model
+
+
+@functools.lru_cache(maxsize=8)
+def initialize_web_search_tool(max_results: int = 2, topic: str = "general") -> TavilySearch:
+    """Tavily Web検索ツールを初期化します。
+
+    ツールは(max_results, topic)ごとに1度だけ生成され、HTTP接続と共に再利用されます。
+
+    Args:
+        max_results (int): 取得する検索結果の最大数。デフォルトは2。
+        topic (str): 検索トピックのカテゴリ。デフォルトは"general"。
+
+    Returns:
+        TavilySearch: 初期化されたTavily検索ツールインスタンス。
+    """
+    from langchain_tavily import TavilySearch
+
+    web_search_tool = TavilySearch(max_results=max_results, topic=topic)
+    return web_search_tool
+
+
+def create_react_agent_with_config(model_name: str, temperature: float) -> Any:
+    """指定された設定でReActエージェントを構築します。
+
+    Args:
+        model_name (str): 使用するAWSモデルの識別子。
+        temperature (float): モデルの温度パラメータ（0.0-1.0）。
+
+    Returns:
+        CompiledGraph: 構築されたLangGraph ReActエージェントインスタンス。
+    """
+    from langgraph.prebuilt import create_react_agent
+
+    # チャットモデルの初期化
+    chat_model = initialize_chat_model(model_name, temperature)
 
     # Web検索ツールの設定
-    web_search_tools = [TavilySearch(max_results=2, topic="general")]
+    web_search_tools = [initialize_web_search_tool(max_results=2, topic="general")]
 
     # ReActエージェントの構築
     react_agent = create_react_agent(chat_model, web_search_tools)
@@ -104,27 +197,43 @@ def create_react_agent_with_config(model_name: str, temperature: float) -> Any:
 def convert_to_langchain_prompt(prompt_template: Any, variables: Dict[str, str]) -> Any:
     """LangfuseプロンプトテンプレートをLangChainプロンプトに変換して変数を適用します。
 
+    Langfuseのコンパイル機能で変数を適用し、メッセージを直接構築します。
+    未解決の変数やプレースホルダーが残る場合は、
+    コンパイル済みのLangChainテンプレート経由で生成します。
+
     Args:
         prompt_template: Langfuseプロンプトテンプレートオブジェクト。
         variables (Dict[str, str]): プロンプトに適用する変数の辞書。
 
     Returns:
         Any: 変数が適用されたLangChainメッセージオブジェクト。
+
+    Raises:
+        KeyError: テンプレートに必要な変数がvariablesに含まれていない場合。
     """
-    langchain_prompt_template = ChatPromptTemplate(
-        prompt_template.get_langchain_prompt()
-    )
+    prompt_messages = build_messages_from_compiled_prompt(prompt_template, variables)
+    if prompt_messages is not None:
+        return prompt_messages
+
+    langchain_prompt_template = get_or_compile_template(prompt_template)
     prompt_messages = langchain_prompt_template.invoke(variables)
 
     return prompt_messages
 
 
+@functools.cache
 def setup_langfuse_callback_handler() -> CallbackHandler:
     """Langfuseトレーシング用のコールバックハンドラーを作成します。
 
+    ハンドラーはプロセス内で1度だけ生成され、全ての呼び出しで再利用されます。
+    イベントは共有のLangfuseクライアントを通じてバッチ送信されます。
+
     Returns:
         CallbackHandler: Langfuseコールバックハンドラーインスタンス。
     """
+    from langfuse.langchain import CallbackHandler
+
+    initialize_langfuse_client()
     langfuse_callback = CallbackHandler()
     return langfuse_callback
 
@@ -151,6 +260,34 @@ def execute_agent_with_messages(
     return agent_response
 
 
+def execute_agent_batch(
+    agent: Any,
+    prompt_messages_list: List[Any],
+    langfuse_callback: CallbackHandler,
+    max_concurrency: int = AGENT_BATCH_MAX_CONCURRENCY
+) -> List[Dict[str, List[Any]]]:
+    """複数のプロンプトメッセージをReActエージェントで並行して実行します。
+
+    Args:
+        agent: 初期化済みのReActエージェント。
+        prompt_messages_list (List[Any]): 実行するプロンプトメッセージのリスト。
+        langfuse_callback (CallbackHandler): Langfuseコールバックハンドラー。
+        max_concurrency (int): 同時に実行する最大数。
+            デフォルトはAGENT_BATCH_MAX_CONCURRENCY。
+
+    Returns:
+        List[Dict[str, List[Any]]]: 各プロンプトに対するエージェントの実行結果のリスト（入力と同じ順序）。
+    """
+    agent_responses = agent.batch(
+        prompt_messages_list,
+        config={
+            "callbacks": [langfuse_callback],
+            "max_concurrency": max_concurrency
+        }
+    )
+    return agent_responses
+
+
 def display_final_response(agent_response: Dict[str, List[Any]]) -> None:
     """エージェントの最終応答メッセージを整形して表示します。
 
@@ -170,7 +307,20 @@ def main() -> None:
     # Langfuseクライアントの初期化
     langfuse_client = initialize_langfuse_client()
 
-    # プロンプトテンプレートの取得
+    # プロンプトテンプレートの事前取得
+    warm_thread = warm_prompt_cache(
+        langfuse_client,
+        prompt_name="ai-agent",
+        prompt_type="chat",
+        label="latest"
+    )
+
+    # プロンプトに依存しない初期化処理（プロンプト取得と並行して実行）
+    langfuse_callback = setup_langfuse_callback_handler()
+    preload_agent_dependencies()
+
+    # プロンプトテンプレートの取得（事前取得済みのキャッシュを使用）
+    warm_thread.join()
     prompt_template = fetch_prompt_template_from_langfuse(
         langfuse_client,
         prompt_name="ai-agent",
@@ -191,9 +341,6 @@ def main() -> None:
     prompt_variables = {"city": "横浜"}
     prompt_messages = convert_to_langchain_prompt(prompt_template, prompt_variables)
 
-    # Langfuseコールバックの設定
-    langfuse_callback = setup_langfuse_callback_handler()
-
     # エージェントの実行
     agent_response = execute_agent_with_messages(
         react_agent,
@@ -5,18 +5,53 @@
 全ての主要な関数はLangfuseの@observeデコレーターでトレーシングされます。
 """
 
+import asyncio
+import contextvars
+import hashlib
+import io
+import logging
 import os
-from typing import List
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, TextIO, Tuple, TypeVar
 
 import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
 from dotenv import load_dotenv
-from langfuse import observe
+from langfuse import get_client, observe
 from tavily import TavilyClient
 
 
 # 環境変数の読み込み
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# 並列Web検索で使用するワーカースレッドの最大数
+SEARCH_MAX_WORKERS = 8
+
+# Bedrock呼び出しのリトライ設定
+BEDROCK_MAX_ATTEMPTS = 5
+BEDROCK_MAX_BACKOFF_SECONDS = 30
+BEDROCK_RETRYABLE_ERROR_CODES = frozenset(
+    {
+        "ThrottlingException",
+        "TooManyRequestsException",
+        "ServiceUnavailable",
+        "ServiceUnavailableException",
+        # ConverseStreamのストリーム受信中にEventStreamErrorとして通知されるエラー
+        "throttlingException",
+        "serviceUnavailableException",
+        "modelStreamErrorException",
+    }
+)
+
+T = TypeVar("T")
+
 
 class BedrockClientConfig:
     """AWS Bedrockクライアントの設定を管理するクラス。"""
@@ -24,10 +59,22 @@ class BedrockClientConfig:
     def __init__(self, model_id: str = "us.anthropic.claude-3-7-sonnet-20250219-v1:0"):
         """BedrockClientConfigを初期化します。
 
+        並行リクエストに備えて接続プールを拡張し、TCPキープアライブで
+        接続を再利用します。スロットリング時の再試行はinvoke_bedrock_with_retryが
+        担うため、botocore側の再試行は無効にしています。
+
         Args:
             model_id (str): 使用するBedrockモデルのID。
         """
-        self.client = boto3.client("bedrock-runtime")
+        client_config = Config(
+            max_pool_connections=50,
+            # 再試行はinvoke_bedrock_with_retryに一本化する（二重の再試行を避ける）
+            retries={"total_max_attempts": 1, "mode": "adaptive"},
+            read_timeout=120,
+            connect_timeout=5,
+            tcp_keepalive=True,
+        )
+        self.client = boto3.client("bedrock-runtime", config=client_config)
         self.model_id = model_id
 
 
@@ -43,10 +90,170 @@ class TavilySearchClient:
         self.client = TavilyClient(api_key=api_key or os.environ.get("TAVILY_API_KEY"))
 
 
+class ResponseCache:
+    """有効期間付きでレスポンスを保持するプロセス内キャッシュ。
+
+    キーにはレンダリング済みのプロンプトや検索条件のSHA-256ハッシュを使用します。
+    """
+
+    def __init__(self, ttl_seconds: float, maxsize: int = 1024):
+        """ResponseCacheを初期化します。
+
+        Args:
+            ttl_seconds (float): キャッシュエントリの有効期間（秒）。
+            maxsize (int): 保持するエントリの最大数。デフォルトは1024。
+        """
+        self.ttl_seconds = ttl_seconds
+        self.maxsize = maxsize
+        self._entries: Dict[str, Tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        """キャッシュキーを作成します。
+
+        Args:
+            *parts: キーを構成する値。
+
+        Returns:
+            str: 各値を連結した文字列のSHA-256ハッシュ。
+        """
+        rendered = "\x1f".join(str(part) for part in parts)
+        return hashlib.sha256(rendered.encode()).hexdigest()
+
+    def get(self, key: str) -> Any | None:
+        """有効期間内のキャッシュ値を取得します。
+
+        Args:
+            key (str): キャッシュキー。
+
+        Returns:
+            Any | None: キャッシュされた値。存在しないか期限切れの場合はNone。
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            return value
+
+    def set(self, key: str, value: Any) -> None:
+        """値をキャッシュに保存します。
+
+        Args:
+            key (str): キャッシュキー。
+            value (Any): 保存する値。
+        """
+        with self._lock:
+            if len(self._entries) >= self.maxsize and key not in self._entries:
+                # 挿入順で最も古いエントリを破棄する
+                del self._entries[next(iter(self._entries))]
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+
+
 # グローバルクライアントのインスタンス化
 bedrock_config = BedrockClientConfig()
 tavily_search_client = TavilySearchClient()
 
+# レスポンスキャッシュ（Web検索結果は内容が変わるため有効期間を短くする）
+search_query_cache = ResponseCache(ttl_seconds=24 * 60 * 60)
+search_result_cache = ResponseCache(ttl_seconds=10 * 60)
+
+
+def build_cached_system_prompt(system_prompt: str) -> List[Dict[str, Any]]:
+    """プロンプトキャッシュを有効にしたシステムプロンプトを作成します。
+
+    システムプロンプトの直後にcachePointを配置し、Bedrockが同一の
+    プレフィックスをキャッシュから再利用できるようにします。
+
+    Args:
+        system_prompt (str): システムプロンプトの文字列。
+
+    Returns:
+        List[Dict[str, Any]]: Converse APIのsystemパラメータに渡すブロックのリスト。
+    """
+    return [
+        {"text": system_prompt},
+        {"cachePoint": {"type": "default"}},
+    ]
+
+
+def invoke_bedrock_with_retry(
+    operation: Callable[..., T],
+    can_retry: Callable[[], bool] | None = None,
+    **kwargs: Any
+) -> T:
+    """スロットリング時に指数バックオフで再試行しながらBedrock APIを呼び出します。
+
+    再試行可能なエラーの場合、Retry-Afterヘッダーがあればその秒数、
+    なければジッター付きの指数バックオフで待機してから再試行します。
+
+    Args:
+        operation (Callable[..., T]): 呼び出すBedrockクライアントのメソッド、
+            またはBedrock APIを呼び出してレスポンスを処理する関数。
+        can_retry (Callable[[], bool] | None): 再試行の直前に呼び出され、Falseを返すと
+            再試行せずにエラーを送出します。Noneの場合は常に再試行可能とします。
+        **kwargs: operationに渡す引数。
+
+    Returns:
+        T: operationの戻り値。
+
+    Raises:
+        ClientError: 再試行できないエラー、または最大試行回数を超えた場合。
+    """
+    attempt = 0
+    while True:
+        try:
+            return operation(**kwargs)
+        except ClientError as error:
+            attempt += 1
+            error_code = error.response.get("Error", {}).get("Code")
+            if (
+                error_code not in BEDROCK_RETRYABLE_ERROR_CODES
+                or attempt >= BEDROCK_MAX_ATTEMPTS
+                or (can_retry is not None and not can_retry())
+            ):
+                raise
+
+            headers = error.response.get("ResponseMetadata", {}).get("HTTPHeaders", {})
+            retry_after = headers.get("retry-after", "")
+            if retry_after.isdigit():
+                delay = min(BEDROCK_MAX_BACKOFF_SECONDS, int(retry_after))
+            else:
+                delay = min(BEDROCK_MAX_BACKOFF_SECONDS, 2 ** attempt) + random.random()
+
+            logger.warning(
+                "Bedrock request throttled (%s), retrying in %.1fs (attempt %d/%d)",
+                error_code, delay, attempt, BEDROCK_MAX_ATTEMPTS,
+            )
+            time.sleep(delay)
+
+
+def record_prompt_cache_usage(response: Dict[str, Any]) -> None:
+    """プロンプトキャッシュの利用状況を現在のLangfuseオブザベーションに記録します。
+
+    キャッシュから読み込まれたトークン数などをメタデータとして付与し、
+    Langfuseダッシュボードでキャッシュのヒット率を確認できるようにします。
+
+    Args:
+        response (Dict[str, Any]): Converse APIのレスポンス、
+            またはConverseStream APIのmetadataイベント。
+    """
+    usage = response.get("usage", {})
+    get_client().update_current_span(
+        metadata={
+            "prompt_cache_usage": {
+                "cache_read_input_tokens": usage.get("cacheReadInputTokens", 0),
+                "cache_write_input_tokens": usage.get("cacheWriteInputTokens", 0),
+                "input_tokens": usage.get("inputTokens", 0),
+                "output_tokens": usage.get("outputTokens", 0),
+            }
+        }
+    )
+
 
 @observe
 def generate_web_search_query(user_query: str) -> str:
@@ -54,6 +261,7 @@ def generate_web_search_query(user_query: str) -> str:
 
     AWS Bedrock上のClaudeモデルを使用して、ユーザーの問い合わせ内容を
     Web検索に適した形式のクエリに変換します。
+    同じプロンプトに対する生成結果はキャッシュされ、Bedrockの呼び出しを省略します。
 
     Args:
         user_query (str): ユーザーからの元の問い合わせ内容。
@@ -66,7 +274,12 @@ def generate_web_search_query(user_query: str) -> str:
 
     prompt = f"ユーザの質問: {user_query}"
 
-    system = [{"text": system_prompt}]
+    cache_key = ResponseCache.make_key(bedrock_config.model_id, system_prompt, prompt)
+    cached_search_query = search_query_cache.get(cache_key)
+    if cached_search_query is not None:
+        return cached_search_query
+
+    system = build_cached_system_prompt(system_prompt)
     messages = [
         {
             "role": "user",
@@ -74,19 +287,25 @@ def generate_web_search_query(user_query: str) -> str:
         }
     ]
 
-    response = bedrock_config.client.converse(
+    response = invoke_bedrock_with_retry(
+        bedrock_config.client.converse,
         modelId=bedrock_config.model_id,
         system=system,
         messages=messages,
     )
+    record_prompt_cache_usage(response)
 
-    return response["output"]["message"]["content"][0]["text"]
+    search_query = response["output"]["message"]["content"][0]["text"]
+    search_query_cache.set(cache_key, search_query)
+    return search_query
 
 
 @observe
 def search_web_content(search_query: str, max_results: int = 3) -> List[str]:
     """Tavily APIを使用してWeb検索を実行し、コンテンツを取得します。
 
+    同じ検索条件の結果は短い有効期間でキャッシュされます。
+
     Args:
         search_query (str): 検索クエリ文字列。
         max_results (int): 取得する検索結果の最大数。デフォルトは3。
@@ -94,49 +313,137 @@ def search_web_content(search_query: str, max_results: int = 3) -> List[str]:
     Returns:
         List[str]: 検索結果のコンテンツのリスト。
     """
+    cache_key = ResponseCache.make_key(search_query, max_results)
+    cached_contents = search_result_cache.get(cache_key)
+    if cached_contents is not None:
+        return list(cached_contents)
+
     search_result = tavily_search_client.client.search(
         query=search_query, max_results=max_results
     )
-    return [doc["content"] for doc in search_result["results"]]
+    search_contents = [doc["content"] for doc in search_result["results"]]
+    search_result_cache.set(cache_key, tuple(search_contents))
+    return search_contents
 
 
 @observe
-def generate_markdown_report(user_query: str, search_contents: List[str]) -> str:
+def search_web_content_batch(search_queries: List[str], max_results: int = 3) -> List[List[str]]:
+    """複数の検索クエリに対するWeb検索を並列に実行します。
+
+    共有のTavilyクライアントを使用し、各検索をスレッドプールで同時に実行します。
+
+    Args:
+        search_queries (List[str]): 検索クエリ文字列のリスト。
+        max_results (int): クエリごとに取得する検索結果の最大数。デフォルトは3。
+
+    Returns:
+        List[List[str]]: 各クエリの検索結果コンテンツのリスト（入力と同じ順序）。
+    """
+    if not search_queries:
+        return []
+
+    max_workers = min(SEARCH_MAX_WORKERS, len(search_queries))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # トレースの親子関係を保つため、各スレッドに現在のコンテキストを引き継ぐ
+        futures = [
+            executor.submit(
+                contextvars.copy_context().run,
+                search_web_content,
+                search_query,
+                max_results,
+            )
+            for search_query in search_queries
+        ]
+        return [future.result() for future in futures]
+
+
+@observe(capture_input=False)
+def generate_markdown_report(
+    user_query: str,
+    search_contents: List[str],
+    output_stream: TextIO | None = None
+) -> str:
     """Web検索結果を基にMarkdown形式のレポートを生成します。
 
     AWS Bedrock上のClaudeモデルを使用して、検索結果をMarkdownレポートに要約します。
+    レスポンスはストリーミングで受信し、output_streamが指定された場合は
+    生成されたテキストを受信した順に書き出します。
+    ストリームの開始時および受信中のスロットリングは、output_streamへ
+    まだ何も書き出していない場合に限り最初から再試行します。
 
     Args:
         user_query (str): 元のユーザークエリ。
         search_contents (List[str]): Web検索で取得したコンテンツのリスト。
+        output_stream (TextIO | None): 生成中のテキストを書き出すストリーム。
+            Noneの場合は書き出さずに結果のみを返します。
 
     Returns:
         str: Markdown形式で整形されたレポート。
     """
+    # output_streamはトレースに記録しない
+    get_client().update_current_span(
+        input={"user_query": user_query, "search_contents": search_contents}
+    )
+
     system_prompt = """Web検索した結果とユーザクエリを元にMarkdownのレポートを作成してください。
     タイトルと見出しも作成してください"""
 
-    prompt = f"ユーザの質問: {user_query}\n\n web検索結果: {'\n'.join(search_contents)}"
-
-    system = [{"text": system_prompt}]
+    # キャッシュのプレフィックス一致を得るため、不変の指示と検索結果を先頭に、
+    # 問い合わせごとに変わるユーザクエリを末尾に配置する
+    # 検索結果は大きくなり得るため、中間文字列を作らずに1つのバッファへ書き込む
+    prompt_buffer = io.StringIO()
+    prompt_buffer.write("以下はWeb検索結果に基づくレポート生成タスクです。\n\n web検索結果: ")
+    for index, search_content in enumerate(search_contents):
+        if index:
+            prompt_buffer.write("\n")
+        prompt_buffer.write(search_content)
+    search_results_prompt = prompt_buffer.getvalue()
+    user_query_prompt = f"ユーザの質問: {user_query}"
+
+    system = build_cached_system_prompt(system_prompt)
     messages = [
         {
             "role": "user",
-            "content": [{"text": prompt}],
+            "content": [
+                {"text": search_results_prompt},
+                {"cachePoint": {"type": "default"}},
+                {"text": user_query_prompt},
+            ],
         }
     ]
 
-    response = bedrock_config.client.converse(
+    has_written_output = False
+
+    def stream_report(**kwargs: Any) -> str:
+        nonlocal has_written_output
+        response = bedrock_config.client.converse_stream(**kwargs)
+
+        report_buffer = io.StringIO()
+        for event in response["stream"]:
+            if "contentBlockDelta" in event:
+                text = event["contentBlockDelta"]["delta"].get("text", "")
+                report_buffer.write(text)
+                if output_stream is not None and text:
+                    output_stream.write(text)
+                    output_stream.flush()
+                    has_written_output = True
+            elif "metadata" in event:
+                record_prompt_cache_usage(event["metadata"])
+
+        return report_buffer.getvalue()
+
+    # 書き出し済みのテキストと重複しないよう、出力開始後は再試行しない
+    return invoke_bedrock_with_retry(
+        stream_report,
+        can_retry=lambda: not has_written_output,
         modelId=bedrock_config.model_id,
         system=system,
         messages=messages,
     )
 
-    return response["output"]["message"]["content"][0]["text"]
 
-
-@observe
-def execute_research_workflow(user_query: str) -> str:
+@observe(capture_input=False)
+def execute_research_workflow(user_query: str, output_stream: TextIO | None = None) -> str:
     """ユーザークエリからレポート生成までの全ワークフローを実行します。
 
     このワークフローは以下のステップで構成されます:
@@ -146,27 +453,56 @@ def execute_research_workflow(user_query: str) -> str:
 
     Args:
         user_query (str): ユーザーからの問い合わせ内容。
+        output_stream (TextIO | None): 生成中のレポートを書き出すストリーム。
+            Noneの場合は書き出しません。
 
     Returns:
         str: 生成されたMarkdown形式のレポート。
     """
+    # output_streamはトレースに記録しない
+    get_client().update_current_span(input={"user_query": user_query})
+
     web_search_query = generate_web_search_query(user_query)
     search_contents = search_web_content(web_search_query)
-    markdown_report = generate_markdown_report(web_search_query, search_contents)
+    markdown_report = generate_markdown_report(
+        web_search_query, search_contents, output_stream=output_stream
+    )
 
     return markdown_report
 
 
+@observe
+async def execute_research_workflow_batch(user_queries: List[str]) -> List[str]:
+    """複数のユーザークエリに対するワークフローを並行して実行します。
+
+    各ワークフローは内部では逐次的に実行されますが、ワークフロー同士は
+    別スレッドで同時に実行され、BedrockとTavilyへのリクエストが並行して処理されます。
+
+    Args:
+        user_queries (List[str]): ユーザーからの問い合わせ内容のリスト。
+
+    Returns:
+        List[str]: 各クエリに対応するMarkdown形式のレポートのリスト（入力と同じ順序）。
+    """
+    markdown_reports = await asyncio.gather(
+        *[
+            asyncio.to_thread(execute_research_workflow, user_query)
+            for user_query in user_queries
+        ]
+    )
+    return list(markdown_reports)
+
+
 def main() -> None:
     """メイン実行関数。
 
     サンプルクエリを使用してレポート生成ワークフローを実行し、
-    結果を標準出力に表示します。
+    生成中のレポートを標準出力に逐次表示します。
     """
     user_query = "LangChainとLangGraphのユースケースの違いについて教えてください。"
 
-    generated_report = execute_research_workflow(user_query)
-    print(generated_report)
+    execute_research_workflow(user_query, output_stream=sys.stdout)
+    print()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,120 @@
+"""Langfuseプロンプトテンプレートを扱う共通ユーティリティ。
+
+このモジュールは、convert_to_prompt.pyとexecute_agent.pyで共有する
+プロンプト関連の処理を提供します。モジュールの読み込み時に環境変数の
+読み込みなどの副作用は発生しません。
+"""
+
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from langchain_core.messages import convert_to_messages
+from langchain_core.prompt_values import ChatPromptValue
+from langchain_core.prompts import ChatPromptTemplate
+from langfuse import Langfuse
+
+
+# コンパイル済みLangChainテンプレートのキャッシュ（キー: (プロンプト名, バージョン)）
+COMPILED_TEMPLATE_CACHE_MAXSIZE = 32
+_compiled_template_cache: "OrderedDict[Tuple[str, int], ChatPromptTemplate]" = OrderedDict()
+_compiled_template_cache_lock = threading.Lock()
+
+# Langfuseのコンパイル後に残った未解決の変数（例: {{city}}）
+UNRESOLVED_VARIABLE_PATTERN = re.compile(r"\{\{\s*\w+\s*\}\}")
+
+
+def fetch_prompt_template_from_langfuse(
+    langfuse_client: Langfuse,
+    prompt_name: str,
+    prompt_type: str = "chat",
+    label: str = "latest",
+    cache_ttl_seconds: Optional[int] = None,
+    fallback: Union[str, List[Dict[str, str]], None] = None
+) -> Any:
+    """Langfuseからプロンプトテンプレートを取得します。
+
+    取得したテンプレートはLangfuseクライアント内にキャッシュされ、
+    有効期間内の再取得ではネットワークへのリクエストが発生しません。
+
+    Args:
+        langfuse_client (Langfuse): Langfuseクライアントインスタンス。
+        prompt_name (str): 取得するプロンプトの名前。
+        prompt_type (str): プロンプトのタイプ。デフォルトは"chat"。
+        label (str): プロンプトのラベル/バージョン。デフォルトは"latest"。
+        cache_ttl_seconds (Optional[int]): キャッシュの有効期間（秒）。Noneの場合は
+            SDKの既定値（環境変数LANGFUSE_PROMPT_CACHE_DEFAULT_TTL_SECONDS、未設定時は60秒）。
+        fallback (Union[str, List[Dict[str, str]], None]): 取得に失敗し、キャッシュも
+            ない場合に使用するプロンプト。Noneの場合は取得失敗時にエラーを送出します。
+
+    Returns:
+        Any: Langfuseプロンプトテンプレートオブジェクト。
+    """
+    prompt_template = langfuse_client.get_prompt(
+        prompt_name,
+        type=prompt_type,
+        label=label,
+        cache_ttl_seconds=cache_ttl_seconds,
+        fallback=fallback
+    )
+    return prompt_template
+
+
+def get_or_compile_template(prompt_template: Any) -> ChatPromptTemplate:
+    """LangfuseプロンプトテンプレートをコンパイルしたLangChainテンプレートを取得します。
+
+    コンパイル結果はプロンプト名とバージョンをキーにキャッシュされ、
+    同じバージョンのテンプレートは1度だけコンパイルされます。
+    キャッシュはロックで保護されており、複数スレッドから呼び出せます。
+
+    Args:
+        prompt_template: Langfuseプロンプトテンプレートオブジェクト。
+
+    Returns:
+        ChatPromptTemplate: LangChainのChatPromptTemplateインスタンス。
+    """
+    cache_key = (prompt_template.name, prompt_template.version)
+    with _compiled_template_cache_lock:
+        langchain_prompt_template = _compiled_template_cache.get(cache_key)
+        if langchain_prompt_template is not None:
+            _compiled_template_cache.move_to_end(cache_key)
+            return langchain_prompt_template
+
+        langchain_prompt_template = ChatPromptTemplate(
+            prompt_template.get_langchain_prompt()
+        )
+        _compiled_template_cache[cache_key] = langchain_prompt_template
+        if len(_compiled_template_cache) > COMPILED_TEMPLATE_CACHE_MAXSIZE:
+            _compiled_template_cache.popitem(last=False)
+        return langchain_prompt_template
+
+
+def build_messages_from_compiled_prompt(
+    prompt_template: Any,
+    variables: Dict[str, str]
+) -> Optional[ChatPromptValue]:
+    """Langfuseのコンパイル機能で変数を適用し、LangChainのメッセージを直接構築します。
+
+    Langfuseのコンパイルは不足している変数を{{変数名}}のまま残すため、
+    未解決の変数やプレースホルダーが残る場合はNoneを返します。呼び出し元は
+    その場合にChatPromptTemplate経由の生成に切り替え、不足している変数を
+    KeyErrorとして検出します。
+
+    Args:
+        prompt_template: Langfuseプロンプトテンプレートオブジェクト。
+        variables (Dict[str, str]): テンプレートに適用する変数の辞書。
+
+    Returns:
+        Optional[ChatPromptValue]: 変数が適用されたプロンプトメッセージオブジェクト。
+            全ての変数を解決できなかった場合はNone。
+    """
+    compiled_messages = prompt_template.compile(**variables)
+    for message in compiled_messages:
+        if "role" not in message:
+            return None
+        content = message.get("content")
+        if not isinstance(content, str) or UNRESOLVED_VARIABLE_PATTERN.search(content):
+            return None
+
+    return ChatPromptValue(messages=convert_to_messages(compiled_messages))
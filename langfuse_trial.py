@@ -4,6 +4,7 @@
 Langfuseでトレーシングを行うシンプルなチャット推論の例を提供します。
 """
 
+import functools
 from typing import Any, Dict
 
 from langchain.chat_models import init_chat_model
@@ -11,9 +12,12 @@ from langfuse.langchain import CallbackHandler
 from dotenv import load_dotenv
 
 
+@functools.cache
 def initialize_chat_model() -> Any:
     """AWS Bedrock上でClaude 3.7 Sonnetチャットモデルを初期化します。
 
+    モデル（内部のBedrockクライアントを含む）はプロセス内で1度だけ生成され、再利用されます。
+
     Returns:
         ChatModel: 設定済みのLangChainチャットモデルインスタンス。
     """
@@ -5,11 +5,14 @@ Langfuseでトレーシングを行います。AWS Bedrock上のClaudeモデル
 ユーザーのクエリに対して推論と行動を繰り返しながら回答を生成します。
 """
 
+import atexit
+import functools
 from typing import Any, Dict, List
 
 from langchain.chat_models import init_chat_model
 from langchain_tavily import TavilySearch
 from langgraph.prebuilt import create_react_agent
+from langfuse import Langfuse
 from langfuse.langchain import CallbackHandler
 from dotenv import load_dotenv
 
@@ -17,10 +20,17 @@ from dotenv import load_dotenv
 # 環境変数の読み込み
 load_dotenv()
 
+# Langfuseイベントのバッチ送信設定（件数・間隔（秒））
+LANGFUSE_FLUSH_AT = 50
+LANGFUSE_FLUSH_INTERVAL = 10.0
 
+
+@functools.lru_cache(maxsize=8)
 def initialize_web_search_tool(max_results: int = 2, topic: str = "general") -> TavilySearch:
     """Tavily Web検索ツールを初期化します。
 
+    ツールは(max_results, topic)ごとに1度だけ生成され、HTTP接続と共に再利用されます。
+
     Args:
         max_results (int): 取得する検索結果の最大数。デフォルトは2。
         topic (str): 検索トピックのカテゴリ。デフォルトは"general"。
@@ -32,9 +42,12 @@ def initialize_web_search_tool(max_results: int = 2, topic: str = "general") ->
     return web_search_tool
 
 
+@functools.cache
 def initialize_chat_model() -> Any:
     """AWS Bedrock上でClaude 3.7 Sonnetチャットモデルを初期化します。
 
+    モデル（内部のBedrockクライアントを含む）はプロセス内で1度だけ生成され、再利用されます。
+
     Returns:
         ChatModel: 設定済みのLangChainチャットモデルインスタンス。
     """
@@ -59,12 +72,37 @@ def create_react_agent_with_tools(chat_model: Any, tools: List[Any]) -> Any:
     return react_agent
 
 
+@functools.cache
+def initialize_langfuse_client() -> Langfuse:
+    """Langfuseクライアントを初期化します。
+
+    クライアントはプロセス内で1度だけ生成されます。イベントはバッチでまとめて
+    送信され、プロセス終了時に未送信分がフラッシュされます。
+
+    Returns:
+        Langfuse: 初期化されたLangfuseクライアントインスタンス。
+    """
+    # sample_rateはあえて指定せず、SDKに環境変数LANGFUSE_SAMPLE_RATEを読み取らせる。
+    # ここで値を直接指定すると、get_client()を使う@observe側とサンプリング率が食い違う
+    langfuse_client = Langfuse(
+        flush_at=LANGFUSE_FLUSH_AT,
+        flush_interval=LANGFUSE_FLUSH_INTERVAL
+    )
+    atexit.register(langfuse_client.flush)
+    return langfuse_client
+
+
+@functools.cache
 def setup_langfuse_callback() -> CallbackHandler:
     """Langfuseトレーシング用のコールバックハンドラーを作成します。
 
+    ハンドラーはプロセス内で1度だけ生成され、全ての呼び出しで再利用されます。
+    イベントは共有のLangfuseクライアントを通じてバッチ送信されます。
+
     Returns:
         CallbackHandler: Langfuseコールバックハンドラーインスタンス。
     """
+    initialize_langfuse_client()
     langfuse_callback_handler = CallbackHandler()
     return langfuse_callback_handler
 